@@ -1,11 +1,34 @@
 QDRANT_URL = "http://localhost:6333"
 EMBEDDING_DIM = 3072  # 1536
 MAX_EMBED_BATCH = 100
-EMBED_BATCH_DELAY_S = 1.2 # for rate limit
+EMBED_RATE_LIMIT = 150  # embedding requests per EMBED_RATE_PERIOD_S
+EMBED_RATE_PERIOD_S = 60
+EMBED_MAX_RETRIES = 5  # attempts on 429 before giving up
+EMBED_CACHE_SIZE = 4096  # cached query embeddings
+PIPELINE_QUEUE_SIZE = 2  # embedded batches waiting to be upserted
+BATCH_MODE = True  # embed through the asynchronous Gemini Batch API
+BATCH_POLL_INTERVAL_S = 5
+BATCH_POLL_MAX_INTERVAL_S = 600  # keeps a day of polling well under the Inngest step limit
+BATCH_TIMEOUT_S = 24 * 60 * 60  # Batch API target turnaround
 COLLECTION_NAME = "docs"
+UPSERT_BATCH_SIZE = 256
+UPSERT_WORKERS = 4
+QUANTIZATION_OVERSAMPLING = 2.0
+HNSW_M = 24  # denser graph: slower build, better recall per query
+HNSW_EF_CONSTRUCT = 200
+HNSW_EF_SEARCH = 100  # ~40 for latency-critical queries
+QUERY_BATCH_MAX = 32  # searches coalesced into one Qdrant call
+QUERY_BATCH_WAIT_S = 0.005
 
 EMBED_MODEL = "gemini-embedding-001"  # "gemini-embedding-004
 CHUNK_SIZE = 1000
 OVERLAP = 200#80
+FIXED_SIZE_SPLIT = False  # character windows instead of SentenceSplitter
+# CHUNK_SIZE/OVERLAP are tokens; at ~4 chars per token these match them in characters
+FIXED_CHUNK_CHARS = 4000
+FIXED_OVERLAP_CHARS = 800
+DEDUP_THRESHOLD = 0.85  # Jaccard similarity for near-duplicate chunks
+MINHASH_NUM_PERM = 128
+SHINGLE_SIZE = 5
 
 GEMINI_LLM_MODEL = "gemini-2.5-flash"
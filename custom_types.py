@@ -6,6 +6,11 @@ class RAGChunkAndSrc(pydantic.BaseModel):
     source_id: str = None
 
 
+class RAGBatchJob(pydantic.BaseModel):
+    job_name: str
+    file_name: str
+
+
 class RAGUpsertResult(pydantic.BaseModel):
     ingested: int
 
@@ -1,20 +1,33 @@
 import os
-import time
+import io
+import json
+import asyncio
 import hashlib
-from typing import List
+import functools
+from itertools import islice
+from typing import AsyncIterator, Iterable, Iterator, List
 
+import numpy as np
+from numba import njit
 from google import genai
-from google.genai import types
+from google.genai import types, errors
+from aiolimiter import AsyncLimiter
+from datasketch import MinHash, MinHashLSH
 
-from llama_index.readers.file import PDFReader
+import pymupdf
 from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.utils import globals_helper
 from dotenv import load_dotenv
 from constants import *
+from custom_types import RAGBatchJob
 
 load_dotenv()
 
 _client: genai.Client | None = None
 
+# Shared token bucket for embedding requests, sized to the Gemini quota
+_embed_limiter = AsyncLimiter(max_rate=EMBED_RATE_LIMIT, time_period=EMBED_RATE_PERIOD_S)
+
 
 def get_client() -> genai.Client:
     """
@@ -43,11 +56,99 @@ def get_client() -> genai.Client:
 splitter = SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=OVERLAP)
 
 
+def _warm_up_splitter() -> None:
+    """
+    Loads the splitter's lazy models at import instead of during the
+    first ingest: split_text() loads the tiktoken tokenizer used to
+    count tokens, and reading globals_helper.punkt_tokenizer loads the
+    punkt sentence tokenizer, which short text never reaches.
+    """
+    splitter.split_text("warmup.")
+    _ = globals_helper.punkt_tokenizer
+
+
+_warm_up_splitter()
+
+
+@njit(cache=True)
+def split_offsets(text_len: int, size: int, overlap: int) -> np.ndarray:
+    """
+    Computes (start, end) offsets of fixed-size windows over a text.
+
+    Args:
+        text_len (int): Length of the text
+        size (int): Window size
+        overlap (int): Overlap between consecutive windows
+
+    Raises:
+        ValueError: If overlap is negative or not smaller than size.
+
+    Returns:
+        np.ndarray: Array of shape (n, 2) holding start and end offsets
+    """
+    if overlap < 0 or overlap >= size:
+        raise ValueError("overlap must be non-negative and smaller than size")
+
+    step = size - overlap
+    n = 1
+    if text_len > size:
+        n += (text_len - size + step - 1) // step
+
+    offsets = np.empty((n, 2), dtype=np.int64)
+    for i in range(n):
+        start = i * step
+        offsets[i, 0] = start
+        offsets[i, 1] = min(start + size, text_len)
+
+    return offsets
+
+
+def _fixed_size_split(text: str) -> list[str]:
+    """
+    Splits text into FIXED_CHUNK_CHARS-character windows overlapping
+    by FIXED_OVERLAP_CHARS.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        list[str]: Chunks of the text
+    """
+    return [
+        text[start:end]
+        for start, end in split_offsets(len(text), FIXED_CHUNK_CHARS, FIXED_OVERLAP_CHARS)
+    ]
+
+
+def iter_chunks(path: str) -> Iterator[str]:
+    """
+    Streams chunks of a pdf file page by page, so only one page of
+    extracted text is held in memory at a time.
+
+    Args:
+        path (str): Source of the pdf file
+
+    Yields:
+        str: Stripped, non-empty chunk
+    """
+    with pymupdf.open(path) as doc:
+        for page in doc:
+            text = page.get_text("text")
+            if not text:
+                continue
+
+            # SentenceSplitter respects sentence boundaries, fixed-size is faster
+            split = _fixed_size_split if FIXED_SIZE_SPLIT else splitter.split_text
+            for chunk in split(text):
+                chunk = chunk.strip()
+                if chunk:
+                    yield chunk
+
+
 def load_and_chunk_pdf(path: str):
     """
-    Loads pdf files calling PDFReader() from llama.index library
-    and then split the texts into chunks using SentenceSplitter()
-    from llama.index library.
+    Loads pdf files using PyMuPDF and then split the texts into
+    chunks using SentenceSplitter() from llama.index library.
 
     Args:
         path (str): Source of the pdf file
@@ -56,45 +157,90 @@ def load_and_chunk_pdf(path: str):
         chunks: Split texts from the source file
     """
 
-    docs = PDFReader().load_data(path)
-    texts = [d.text for d in docs if getattr(d, "text", None)]
-
-    # Split each document correctly
-    chunks = splitter.split_texts(texts)
-
     # Deduplicate chunks (huge quota saver)
-    chunks = list(dict.fromkeys(c.strip() for c in chunks if c.strip()))
+    chunks = dict.fromkeys(iter_chunks(path))
+
+    # Drop near-duplicates left over from the chunk overlap
+    chunks = _drop_near_duplicates(chunks)
 
     return chunks
 
-def _batch_iter(items: list[str], batch_size: int):
+
+def _minhash(text: str) -> MinHash:
+    """
+    Computes the MinHash signature of a text from its word shingles.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        MinHash: Signature of the text
+    """
+    words = text.split()
+    shingles = [
+        " ".join(words[i : i + SHINGLE_SIZE]).encode("utf-8")
+        for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))
+    ]
+
+    mh = MinHash(num_perm=MINHASH_NUM_PERM)
+    mh.update_batch(shingles)
+    return mh
+
+
+def _drop_near_duplicates(chunks: Iterable[str]) -> list[str]:
+    """
+    Removes chunks whose estimated Jaccard similarity to an earlier
+    chunk is above DEDUP_THRESHOLD, using MinHash LSH.
+
+    Args:
+        chunks (Iterable[str]): Chunks in document order
+
+    Returns:
+        list[str]: Chunks without near-duplicates, first occurrence kept
+    """
+    lsh = MinHashLSH(threshold=DEDUP_THRESHOLD, num_perm=MINHASH_NUM_PERM)
+    kept = []
+
+    for i, chunk in enumerate(chunks):
+        mh = _minhash(chunk)
+        if lsh.query(mh):
+            continue
+        lsh.insert(f"chunk_{i}", mh)
+        kept.append(chunk)
+
+    return kept
+
+def _batch_iter(items: Iterable[str], batch_size: int):
     """_summary_
 
     Args:
-        items (list[str]): Texts from the source
+        items (Iterable[str]): Texts from the source
         batch_size (int): Batch size
 
     Yields:
-        batch(int): single batch of items
+        batch(list[str]): single batch of items
     """
-    for i in range(0, len(items), batch_size):
-        yield items[i : i + batch_size]
+    it = iter(items)
+    while batch := list(islice(it, batch_size)):
+        yield batch
 
 
 # Embedder
-def embed_texts(texts: list[str]) -> list[list[float]]:
+def embed_texts(texts: Iterable[str]) -> np.ndarray:
     """
-    Embeds input text using gemini client with throttling support.
+    Embeds input text using gemini client.
+    Texts are consumed lazily, one batch at a time, so a generator
+    such as iter_chunks() can be passed directly.
 
     Args:
-        texts (list[str]): Input texts
+        texts (Iterable[str]): Input texts
 
     Returns:
-        list[list[float]]: Embeddings of the input texts
+        np.ndarray: Float32 embeddings of the input texts, one row per text
     """
     gemini_client = get_client()
 
-    all_embeddings: list[list[float]] = []
+    all_embeddings: list[np.ndarray] = []
 
     for batch in _batch_iter(texts, MAX_EMBED_BATCH):
         result = gemini_client.models.embed_content(
@@ -105,9 +251,219 @@ def embed_texts(texts: list[str]) -> list[list[float]]:
 
         # Gemini returns embeddings in the same order as inputs
         batch_embeddings = [item.values for item in result.embeddings]
-        all_embeddings.extend(batch_embeddings)
+        all_embeddings.append(np.asarray(batch_embeddings, dtype=np.float32))
+
+    if not all_embeddings:
+        return np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+
+    return np.concatenate(all_embeddings)
 
-        # Throttle to avoid quota exhaustion
-        time.sleep(EMBED_BATCH_DELAY_S)
 
-    return all_embeddings
+async def _embed_content_limited(gemini_client: genai.Client, batch: list[str]):
+    """
+    Embeds a batch through the shared rate limiter, backing off
+    exponentially when the API still answers with 429.
+
+    Args:
+        gemini_client (genai.Client): Google gemini client
+        batch (list[str]): Texts to embed
+
+    Raises:
+        errors.ClientError: If the request fails, or is still rate
+                            limited after EMBED_MAX_RETRIES attempts.
+
+    Returns:
+        types.EmbedContentResponse: Embeddings of the batch
+    """
+    delay = 1.0
+    for attempt in range(EMBED_MAX_RETRIES):
+        try:
+            async with _embed_limiter:
+                return await gemini_client.aio.models.embed_content(
+                    model=EMBED_MODEL,
+                    contents=batch,
+                    config=types.EmbedContentConfig(output_dimensionality=EMBEDDING_DIM),
+                )
+        except errors.ClientError as e:
+            if e.code != 429 or attempt == EMBED_MAX_RETRIES - 1:
+                raise
+
+        await asyncio.sleep(delay)
+        delay *= 2
+
+
+async def embed_batches(texts: Iterable[str]) -> AsyncIterator[tuple[list[str], np.ndarray]]:
+    """
+    Embeds input text with the async gemini client, yielding each
+    batch as soon as it is embedded so callers can process it while
+    the next batch is requested.
+
+    Args:
+        texts (Iterable[str]): Input texts
+
+    Yields:
+        tuple[list[str], np.ndarray]: Batch of texts and their float16 embeddings
+    """
+    gemini_client = get_client()
+
+    for batch in _batch_iter(texts, MAX_EMBED_BATCH):
+        result = await _embed_content_limited(gemini_client, batch)
+
+        yield batch, np.asarray([item.values for item in result.embeddings], dtype=np.float16)
+
+
+@functools.lru_cache(maxsize=EMBED_CACHE_SIZE)
+def embed_single(text: str) -> np.ndarray:
+    """
+    Embeds a single text, caching the result so repeated queries
+    skip the embedding API round trip.
+
+    Args:
+        text (str): Input text
+
+    Returns:
+        np.ndarray: Read-only float32 embedding of the input text
+    """
+    # A float32 row is ~12 KB per cache entry, versus ~98 KB as a tuple of floats
+    vector = embed_texts([text])[0].copy()
+    vector.flags.writeable = False
+    return vector
+
+
+# Terminal batch job states. A partially succeeded job is missing embeddings
+# for some chunks, so it is treated as failed.
+BATCH_DONE_STATES = frozenset({
+    types.JobState.JOB_STATE_SUCCEEDED.value,
+})
+BATCH_FAILED_STATES = frozenset({
+    types.JobState.JOB_STATE_PARTIALLY_SUCCEEDED.value,
+    types.JobState.JOB_STATE_FAILED.value,
+    types.JobState.JOB_STATE_CANCELLED.value,
+    types.JobState.JOB_STATE_EXPIRED.value,
+})
+
+
+async def submit_embed_batch(texts: list[str], source_id: str) -> RAGBatchJob:
+    """
+    Uploads input text as a single JSONL file and submits one Gemini
+    Batch API job to embed it.
+
+    Args:
+        texts (list[str]): Input texts
+        source_id (str): Source of the texts, used as the job display name
+
+    Returns:
+        RAGBatchJob: Names of the submitted job and its uploaded input file
+    """
+    gemini_client = get_client()
+
+    buf = io.BytesIO()
+    for i, text in enumerate(texts):
+        line = {
+            "key": f"chunk_{i}",
+            "request": {
+                "output_dimensionality": EMBEDDING_DIM,
+                "content": {"parts": [{"text": text}]},
+            },
+        }
+        buf.write(json.dumps(line).encode("utf-8") + b"\n")
+    buf.seek(0)
+
+    uploaded = await gemini_client.aio.files.upload(
+        file=buf,
+        config=types.UploadFileConfig(display_name=source_id, mime_type="jsonl"),
+    )
+    batch_job = await gemini_client.aio.batches.create_embeddings(
+        model=EMBED_MODEL,
+        src=types.EmbeddingsBatchJobSource(file_name=uploaded.name),
+        config={"display_name": source_id},
+    )
+
+    return RAGBatchJob(job_name=batch_job.name, file_name=uploaded.name)
+
+
+async def get_embed_batch_state(job_name: str) -> str:
+    """
+    Retrieves the current state of a batch job.
+
+    Args:
+        job_name (str): Name of the batch job
+
+    Returns:
+        str: Job state, e.g. JOB_STATE_RUNNING
+    """
+    batch_job = await get_client().aio.batches.get(name=job_name)
+    return batch_job.state.value
+
+
+async def download_embed_batch(job_name: str, count: int) -> np.ndarray:
+    """
+    Downloads and parses the results of a finished batch job.
+
+    Args:
+        job_name (str): Name of the batch job
+        count (int): Number of texts submitted with the job
+
+    Raises:
+        RuntimeError: If any request in the job failed or is missing.
+
+    Returns:
+        np.ndarray: Float16 embeddings of the input texts, in input order
+    """
+    gemini_client = get_client()
+
+    batch_job = await gemini_client.aio.batches.get(name=job_name)
+    content = await gemini_client.aio.files.download(file=batch_job.dest.file_name)
+
+    # Results are not guaranteed to come back in input order. Lines are
+    # parsed straight from the bytes, so only one decoded line is alive at a time.
+    embeddings = np.empty((count, EMBEDDING_DIM), dtype=np.float16)
+    received = np.zeros(count, dtype=bool)
+    for line in io.BytesIO(content):
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if "error" in item:
+            raise RuntimeError(f"Batch request {item.get('key')} failed: {item['error']}")
+        index = int(item["key"].removeprefix("chunk_"))
+        embeddings[index] = item["response"]["embedding"]["values"]
+        received[index] = True
+
+    if not received.all():
+        raise RuntimeError(f"Batch job {job_name} returned incomplete results")
+
+    return embeddings
+
+
+async def cancel_embed_batch(job: RAGBatchJob) -> None:
+    """
+    Cancels a batch job that is still running and deletes its files.
+
+    Args:
+        job (RAGBatchJob): Submitted batch job
+    """
+    await get_client().aio.batches.cancel(name=job.job_name)
+    await delete_embed_batch_files(job)
+
+
+async def delete_embed_batch_files(job: RAGBatchJob) -> None:
+    """
+    Deletes the uploaded input file and the result file of a batch job.
+    Files that are already gone are skipped, so this is safe to retry.
+
+    Args:
+        job (RAGBatchJob): Submitted batch job
+    """
+    gemini_client = get_client()
+
+    batch_job = await gemini_client.aio.batches.get(name=job.job_name)
+    file_names = [job.file_name]
+    if batch_job.dest and batch_job.dest.file_name:
+        file_names.append(batch_job.dest.file_name)
+
+    for file_name in file_names:
+        try:
+            await gemini_client.aio.files.delete(name=file_name)
+        except errors.ClientError as e:
+            if e.code != 404:
+                raise
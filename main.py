@@ -1,6 +1,9 @@
 import os
+import asyncio
 import logging
 import uuid
+import hashlib
+import datetime
 from fastapi import FastAPI
 
 import inngest
@@ -9,8 +12,19 @@ from inngest.experimental.ai import gemini
 from dotenv import load_dotenv
 
 from custom_types import *
-from data_loader import load_and_chunk_pdf, embed_texts
-from vector_db import QdrantStorage
+from data_loader import (
+    load_and_chunk_pdf,
+    embed_batches,
+    embed_single,
+    submit_embed_batch,
+    get_embed_batch_state,
+    download_embed_batch,
+    cancel_embed_batch,
+    delete_embed_batch_files,
+    BATCH_DONE_STATES,
+    BATCH_FAILED_STATES,
+)
+from vector_db import QdrantStorage, QueryBatcher
 import constants as const
 
 # Load environment variables
@@ -25,6 +39,143 @@ inngest_client = inngest.Inngest(
 )
 
 
+_storage: QdrantStorage | None = None
+_batcher: QueryBatcher | None = None
+
+
+def get_storage() -> QdrantStorage:
+    """
+    Retrieves a shared QdrantStorage, so the collection check and
+    client connections are set up once rather than per request.
+
+    Returns:
+        QdrantStorage: Qdrant storage for the configured collection
+    """
+    global _storage
+
+    if _storage is None:
+        _storage = QdrantStorage()
+
+    return _storage
+
+
+def get_batcher() -> QueryBatcher:
+    """
+    Retrieves a shared QueryBatcher, so concurrent query runs are
+    coalesced into the same Qdrant batch calls.
+
+    Returns:
+        QueryBatcher: Query batcher over the shared QdrantStorage
+    """
+    global _batcher
+
+    if _batcher is None:
+        _batcher = QueryBatcher(get_storage())
+
+    return _batcher
+
+
+def _point_ids(source_id: str, count: int) -> list[str]:
+    """
+    Builds deterministic uuid5 point ids for the chunks of a source.
+    Equivalent to uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}"), but
+    the namespace and source prefix are hashed once and reused.
+
+    Args:
+        source_id (str): Source of the chunks
+        count (int): Number of chunks
+
+    Returns:
+        list[str]: Point ids in chunk order
+    """
+    prefix = hashlib.sha1(uuid.NAMESPACE_URL.bytes + f"{source_id}:".encode())
+
+    ids = []
+    for i in range(count):
+        h = prefix.copy()
+        h.update(str(i).encode())
+        ids.append(str(uuid.UUID(bytes=h.digest()[:16], version=5)))
+
+    return ids
+
+
+async def _embed_and_upsert(
+    storage: QdrantStorage, chunks: list[str], ids: list[str], payloads: list[dict]
+) -> None:
+    """
+    Embeds chunks batch by batch and upserts every batch as soon as it
+    is embedded, so Qdrant writes overlap with the next embedding call.
+    A bounded queue between the two stages provides backpressure.
+
+    Args:
+        storage (QdrantStorage): Target Qdrant storage
+        chunks (list[str]): Chunks to embed
+        ids (list[str]): Point ids, aligned with chunks
+        payloads (list[dict]): Point payloads, aligned with chunks
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=const.PIPELINE_QUEUE_SIZE)
+
+    async def _produce():
+        start = 0
+        async for batch, vectors in embed_batches(chunks):
+            await queue.put((start, vectors))
+            start += len(batch)
+        await queue.put(None)
+
+    async def _consume():
+        while (item := await queue.get()) is not None:
+            start, vectors = item
+            end = start + len(vectors)
+            await storage.aupsert(ids[start:end], vectors, payloads[start:end])
+
+    # A failure in either stage cancels the other
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(_produce())
+        tg.create_task(_consume())
+
+
+async def _wait_for_embed_batch(ctx: inngest.Context, job: RAGBatchJob) -> None:
+    """
+    Polls a Gemini batch job with durable Inngest sleeps and exponential
+    backoff until it reaches a terminal state. Every poll and sleep is its
+    own step, so a retried run resumes polling instead of resubmitting.
+
+    Args:
+        ctx (inngest.Context): Inngest native Context object
+        job (RAGBatchJob): Submitted batch job
+
+    Raises:
+        inngest.NonRetriableError: If the job fails or misses BATCH_TIMEOUT_S.
+    """
+    delay = const.BATCH_POLL_INTERVAL_S
+    waited = 0
+    attempt = 0
+
+    while True:
+        state = await ctx.step.run(
+            f"poll-embed-batch-{attempt}",
+            lambda: get_embed_batch_state(job.job_name),
+        )
+
+        if state in BATCH_DONE_STATES:
+            return
+
+        if state in BATCH_FAILED_STATES:
+            await ctx.step.run("delete-embed-batch-files", lambda: delete_embed_batch_files(job))
+            raise inngest.NonRetriableError(f"Batch job {job.job_name} ended with state {state}")
+
+        if waited >= const.BATCH_TIMEOUT_S:
+            await ctx.step.run("cancel-embed-batch", lambda: cancel_embed_batch(job))
+            raise inngest.NonRetriableError(
+                f"Batch job {job.job_name} did not finish within {const.BATCH_TIMEOUT_S}s"
+            )
+
+        await ctx.step.sleep(f"wait-embed-batch-{attempt}", datetime.timedelta(seconds=delay))
+        waited += delay
+        delay = min(delay * 2, const.BATCH_POLL_MAX_INTERVAL_S)
+        attempt += 1
+
+
 # RAG: Ingest PDF
 @inngest_client.create_function(
     fn_id="RAG: Ingest PDF",
@@ -57,15 +208,19 @@ async def rag_ingest_pdf(ctx: inngest.Context):
 
         return RAGChunkAndSrc(chunks=chunks, source_id=source_id)
 
-    def _upsert(chunks_and_src: RAGChunkAndSrc) -> RAGUpsertResult:
+    async def _upsert(chunks_and_src: RAGChunkAndSrc, job: RAGBatchJob | None) -> RAGUpsertResult:
         """
         Retrieves the data chunks and source ids then
         updates and inserts points into Qdrant database
-        using QdrantStorage().upsert()
+        using get_storage(). Embeddings come from the finished Gemini
+        batch job when one is given, otherwise embedding and upserting
+        are pipelined batch by batch.
 
         Args:
             chunks_and_src (RAGChunkAndSrc): Pydantic object storing
                                              chunks and source ids
+            job (RAGBatchJob | None): Finished batch job holding the
+                                      embeddings of the chunks
 
         Returns:
             RAGUpsertResult: Number of points inserted into the Qdrant database
@@ -73,18 +228,30 @@ async def rag_ingest_pdf(ctx: inngest.Context):
         chunks = chunks_and_src.chunks
         source_id = chunks_and_src.source_id
 
-        logging.info(f"🔢 Embedding {len(chunks)} chunks...")
+        ids = _point_ids(source_id, len(chunks))
+        payloads = [{"source": source_id, "text": chunks[i]} for i in range(len(chunks))]
+        storage = get_storage()
 
         # Using Gemini embedding model
-        vectors = embed_texts(chunks)
+        if job is not None:
+            try:
+                vectors = await download_embed_batch(job.job_name, len(chunks))
+            except RuntimeError as e:
+                # Failed or missing results are in the file itself, so
+                # retrying would fail the same way
+                await delete_embed_batch_files(job)
+                raise inngest.NonRetriableError(str(e)) from e
 
-        logging.info(
-            f"✅ Generated {len(vectors)} vectors (dim={len(vectors[0]) if vectors else 0})"
-        )
-        ids = [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source_id}:{i}")) for i in range(len(chunks))]
-        payloads = [{"source": source_id, "text": chunks[i]} for i in range(len(chunks))]
+            logging.info(f"✅ Generated {vectors.shape[0]} vectors (dim={vectors.shape[1]})")
+
+            await storage.aupsert(ids, vectors, payloads)
 
-        QdrantStorage().upsert(ids, vectors, payloads)
+            # Only after the upsert, so a retried step can download again
+            await delete_embed_batch_files(job)
+        else:
+            logging.info(f"🔢 Embedding {len(chunks)} chunks...")
+
+            await _embed_and_upsert(storage, chunks, ids, payloads)
 
         logging.info(f"💾 Upserted {len(ids)} vectors to Qdrant")
 
@@ -96,9 +263,23 @@ async def rag_ingest_pdf(ctx: inngest.Context):
         output_type=RAGChunkAndSrc,
     )
 
+    # Submitting, polling and downloading are separate steps, so a retry
+    # never resubmits a (separately billed) batch job
+    job = None
+    if const.BATCH_MODE and chunks_and_src.chunks:
+        logging.info(f"🔢 Submitting {len(chunks_and_src.chunks)} chunks for batch embedding...")
+
+        job = await ctx.step.run(
+            "submit-embed-batch",
+            lambda: submit_embed_batch(chunks_and_src.chunks, chunks_and_src.source_id),
+            output_type=RAGBatchJob,
+        )
+
+        await _wait_for_embed_batch(ctx, job)
+
     ingested = await ctx.step.run(
         "embed-and-upsert",
-        lambda: _upsert(chunks_and_src),
+        lambda: _upsert(chunks_and_src, job),
         output_type=RAGUpsertResult,
     )
 
@@ -112,11 +293,11 @@ async def rag_ingest_pdf(ctx: inngest.Context):
 )
 async def rag_query_pdf_ai(ctx: inngest.Context):
     
-    def _search(question: str, top_k: int = 5) -> RAGSearchResult:
+    async def _search(question: str, top_k: int = 5) -> RAGSearchResult:
         """
         Enables search functionality through search() for a Qdrant
         database and supports converting input to embedding by leveraging
-        embed_texts().
+        embed_single() on a worker thread, which caches repeated questions.
 
         Args:
             question (str): Input query
@@ -128,11 +309,13 @@ async def rag_query_pdf_ai(ctx: inngest.Context):
         """
         logging.info(f"🔍 Searching for question: {question}")
 
-        query_vector = embed_texts([question])[0]
+        # Cache misses block on the Gemini HTTP call, so keep them off the
+        # event loop where other queries are waiting in the QueryBatcher
+        query_vector = (await asyncio.to_thread(embed_single, question)).tolist()
         logging.info(f"✅ Embedded question into vector of dim={len(query_vector)}")
 
-        db = QdrantStorage()
-        found = db.search(query_vector, top_k)
+        # Batched with other in-flight searches into one Qdrant call
+        found = await get_batcher().search(query_vector, top_k)
 
         logging.info(f"📊 Found {len(found['contexts'])} contexts")
         logging.debug(f"Contexts: {found['contexts'][:2]}")  # Log first 2 contexts
@@ -1,52 +1,269 @@
+import asyncio
 import logging
 
-from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
+import numpy as np
+from numba import njit, prange
+from qdrant_client import QdrantClient, AsyncQdrantClient
+from qdrant_client.models import (
+    VectorParams,
+    Distance,
+    PointStruct,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    HnswConfigDiff,
+    SearchParams,
+    QuantizationSearchParams,
+    PayloadSelectorInclude,
+    QueryRequest,
+)
 import constants as const
 
+# Only the fields search results are built from
+SEARCH_PAYLOAD = PayloadSelectorInclude(include=["text", "source"])
+
+# Expected vector width for rerank. The kernel itself reads the width from
+# its inputs, since njit's on-disk cache would freeze a global here.
+DIM = const.EMBEDDING_DIM
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _cosine_scores(query, candidates):
+    q_norm = np.sqrt(np.dot(query, query))
+    scores = np.zeros(candidates.shape[0], dtype=np.float32)
+
+    for i in prange(candidates.shape[0]):
+        dot = np.float32(0.0)
+        c_norm = np.float32(0.0)
+        for j in range(candidates.shape[1]):
+            c = candidates[i, j]
+            dot += query[j] * c
+            c_norm += c * c
+        if q_norm > 0 and c_norm > 0:
+            scores[i] = dot / (q_norm * np.sqrt(c_norm))
+
+    return scores
+
+
+def rerank(query: np.ndarray, cand: np.ndarray) -> np.ndarray:
+    """
+    Reranks candidate vectors by exact cosine similarity to a query,
+    e.g. after oversampling top_k from the quantized index.
+
+    Args:
+        query (np.ndarray): Query vector of shape (DIM,)
+        cand (np.ndarray): Candidate vectors of shape (k, DIM)
+
+    Raises:
+        ValueError: If the vectors are not EMBEDDING_DIM wide.
+
+    Returns:
+        np.ndarray: Candidate row indices, most similar first
+    """
+    query = np.ascontiguousarray(query, dtype=np.float32)
+    cand = np.ascontiguousarray(cand, dtype=np.float32)
+
+    if query.shape != (DIM,) or cand.ndim != 2 or cand.shape[1] != DIM:
+        raise ValueError(f"Expected vectors of dim={DIM}, got {query.shape} and {cand.shape}")
+
+    scores = _cosine_scores(query, cand)
+    return np.argsort(-scores, kind="stable")
+
 class QdrantStorage:
     """
     Configuration for Qdrant database with update, insert and search functionality.
     """
     def __init__(self, url=const.QDRANT_URL, collection=const.COLLECTION_NAME, dim=const.EMBEDDING_DIM,):
 
-        self.client = QdrantClient(url=url, timeout=30)
+        self.client = QdrantClient(url=url, prefer_grpc=True, timeout=30)
+        self.async_client = AsyncQdrantClient(url=url, prefer_grpc=True, timeout=30)
         self.collection = collection
 
         if not self.client.collection_exists(self.collection):
             self.client.create_collection(
                 collection_name=self.collection,
-                vectors_config=VectorParams(size=dim, distance=Distance.COSINE),
+                vectors_config=VectorParams(size=dim, distance=Distance.COSINE, on_disk=False),
+                quantization_config=BinaryQuantization(
+                    binary=BinaryQuantizationConfig(always_ram=True),
+                ),
+                hnsw_config=HnswConfigDiff(m=const.HNSW_M, ef_construct=const.HNSW_EF_CONSTRUCT),
             )
 
-    def upsert(self, ids, vectors, payloads) -> None:
-        points = [
-            PointStruct(id=ids[i], vector=vectors[i], payload=payloads[i])
-            for i in range(len(ids))
-        ]
-        self.client.upsert(self.collection, points=points)
+    def _point_batches(self, ids, vectors, payloads, batch_size: int):
+        # Vectors may be a compact float16 array; rows are converted to
+        # Python floats one batch at a time.
+        for start in range(0, len(ids), batch_size):
+            end = min(start + batch_size, len(ids))
+            rows = np.asarray(vectors[start:end]).tolist()
+            yield [
+                PointStruct(id=ids[i], vector=rows[i - start], payload=payloads[i])
+                for i in range(start, end)
+            ]
+
+    async def aupsert(self, ids, vectors, payloads, batch_size: int = const.UPSERT_BATCH_SIZE) -> None:
+        # Batches are dispatched concurrently without waiting; the last one is
+        # held back and sent with wait=True once the others are acknowledged.
+        # At most UPSERT_WORKERS batches are in flight, so batches are only
+        # built as fast as they are sent.
+        slots = asyncio.Semaphore(const.UPSERT_WORKERS)
+
+        async def _send(points):
+            try:
+                await self.async_client.upsert(self.collection, points=points, wait=False)
+            finally:
+                slots.release()
 
-    def search(self, query_vector, top_k: int = 5):
+        last = None
+        async with asyncio.TaskGroup() as tg:
+            for batch in self._point_batches(ids, vectors, payloads, batch_size):
+                if last is not None:
+                    await slots.acquire()
+                    tg.create_task(_send(last))
+                last = batch
+
+        if last is not None:
+            await self.async_client.upsert(self.collection, points=last, wait=True)
+
+    def search(self, query_vector, top_k: int = 5, ef: int = const.HNSW_EF_SEARCH):
+        """
+        Searches the collection for the closest chunks to a query vector.
+
+        Args:
+            query_vector (list[float]): Embedded query
+            top_k (int, optional): Number of results. Defaults to 5.
+            ef (int, optional): HNSW beam width at query time. Higher is
+                                better recall, lower is lower latency
+                                (~40 for latency-critical queries).
+                                Defaults to HNSW_EF_SEARCH.
+
+        Returns:
+            dict: Contexts and sources of the closest chunks
+        """
 
         response = self.client.query_points(
             collection_name=self.collection,
             query=query_vector,
             limit=top_k,
-            with_payload=True,
+            with_payload=SEARCH_PAYLOAD,
+            search_params=self._search_params(ef),
         )
 
-        results = response.points
+        return self._to_result(response.points)
+
+    async def asearch_batch(self, queries) -> list[dict]:
+        """
+        Runs several searches in one query_batch_points call, which
+        Qdrant executes concurrently server-side.
+
+        Args:
+            queries (list[tuple]): (query_vector, top_k, ef) per search
+
+        Returns:
+            list[dict]: Contexts and sources per search, in query order
+        """
+        responses = await self.async_client.query_batch_points(
+            collection_name=self.collection,
+            requests=[
+                QueryRequest(
+                    query=query_vector,
+                    limit=top_k,
+                    with_payload=SEARCH_PAYLOAD,
+                    params=self._search_params(ef),
+                )
+                for query_vector, top_k, ef in queries
+            ],
+        )
+
+        return [self._to_result(response.points) for response in responses]
+
+    @staticmethod
+    def _search_params(ef: int) -> SearchParams:
+        # Traverse with the binary index, then rescore candidates in full precision
+        return SearchParams(
+            hnsw_ef=ef,
+            quantization=QuantizationSearchParams(
+                ignore=False,
+                rescore=True,
+                oversampling=const.QUANTIZATION_OVERSAMPLING,
+            ),
+        )
+
+    @staticmethod
+    def _to_result(results) -> dict:
+        # Every point is upserted with both fields, and dict.fromkeys keeps rank order
+        contexts = [r.payload["text"] for r in results]
+        sources = list(dict.fromkeys(r.payload["source"] for r in results))
+
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"📊 Contexts {contexts}, sources {sources}")
+
+        return {"contexts": contexts, "sources": sources}
+
+
+class QueryBatcher:
+    """
+    Coalesces searches that arrive within a short window into a single
+    query_batch_points call on the underlying QdrantStorage.
+    """
+    def __init__(
+        self,
+        storage: QdrantStorage,
+        max_batch: int = const.QUERY_BATCH_MAX,
+        max_wait_s: float = const.QUERY_BATCH_WAIT_S,
+    ):
+
+        self.storage = storage
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    async def search(self, query_vector, top_k: int = 5, ef: int = const.HNSW_EF_SEARCH) -> dict:
+        """
+        Queues a search and waits for the batch it lands in to finish.
+
+        Args:
+            query_vector (list[float]): Embedded query
+            top_k (int, optional): Number of results. Defaults to 5.
+            ef (int, optional): HNSW beam width at query time.
+                                Defaults to HNSW_EF_SEARCH.
+
+        Returns:
+            dict: Contexts and sources of the closest chunks
+        """
+        # The worker is bound to the running loop, so start it lazily
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query_vector, top_k, ef, future))
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            batch = [await self._queue.get()]
 
-        contexts = []
-        sources = set()
+            # Collect more searches until the batch is full or the window closes
+            deadline = loop.time() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except TimeoutError:
+                    break
 
-        for r in results:
-            payload = getattr(r, "payload", None) or {}
-            text = payload.get("text", "")
-            source = payload.get("source", "")
-            if text:
-                contexts.append(text)
-                sources.add(source)
+            try:
+                results = await self.storage.asearch_batch([item[:3] for item in batch])
+            except Exception as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
 
-        logging.info(f"📊 CONTEXT TEST {contexts}, {sources}")
-        return {"contexts": contexts, "sources": list(sources)}
\ No newline at end of file
+            for (*_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
\ No newline at end of file